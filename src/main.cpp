@@ -1,6 +1,13 @@
+#include <cmath>
+#include <csignal>
 #include <cstdio>
+#include <functional>
+#include <giomm/unixsocketaddress.h>
+#include <glib-unix.h>
 #include <gtkmm.h>
 #include <iostream>
+#include <map>
+#include <sstream>
 #include <string>
 #include <vector>
 
@@ -17,6 +24,42 @@ const char *CSS = R"(
     label { font-size: 16px; margin: 0 10px; }
 )";
 
+struct Rotation
+{
+    const char *label;
+    int transform, col, row;
+};
+
+// Buttons laid out as a compass around the empty centre cell
+constexpr Rotation ROTATIONS[] = {
+    {"Normal", 0, 1, 0},
+    {"Left", 1, 0, 1},
+    {"Inverted", 2, 1, 2},
+    {"Right", 3, 2, 1},
+};
+
+const std::string BACKLIGHT_DIR = "/sys/class/backlight";
+const char *const TOOLS[] = {"brightnessctl", "hyprctl", "hyprsunset", "pgrep", "pkill", "sh"};
+
+// Look a tool up in $PATH once and reuse the absolute path for every later spawn
+const std::string &resolve_tool(const std::string &name)
+{
+    static std::map<std::string, std::string> cache;
+
+    auto it = cache.find(name);
+    if (it == cache.end())
+    {
+        std::string path = Glib::find_program_in_path(name);
+        if (path.empty())
+        {
+            std::cerr << "Warning: " << name << " not found in PATH" << std::endl;
+            path = name;
+        }
+        it = cache.emplace(name, path).first;
+    }
+    return it->second;
+}
+
 class DisplayApp : public Gtk::ApplicationWindow
 {
   public:
@@ -33,24 +76,234 @@ class DisplayApp : public Gtk::ApplicationWindow
         setup_rotation();
     }
 
+    // An active night light is meant to outlive the window, but an instance left in
+    // identity mode is just an idle process, so terminate it on shutdown
+    void release_night_light()
+    {
+        if (!m_sunset || m_night_switch.get_active())
+            return;
+        if (m_verbose)
+            std::cout << "[SIG]: SIGTERM " << m_sunset->get_identifier() << std::endl;
+        m_sunset->send_signal(SIGTERM);
+    }
+
   private:
     Gtk::Box m_vbox;
     Gtk::Scale m_bright_scale, m_temp_scale;
     Gtk::Switch m_night_switch;
-    sigc::connection m_debounce_conn;
+    sigc::connection m_temp_settle_conn, m_bright_flush_conn;
+    int m_bright_pending = 0;
+    // Last values handed to the system, used to skip redundant spawns
+    int m_applied_bright = 0, m_applied_temp = 0;
+    // Backlight brightness node and its max_brightness, found once at startup
+    std::string m_backlight_path;
+    int m_backlight_max = 0;
+    // hyprsunset spawned by us, reset once it has exited
+    Glib::RefPtr<Gio::Subprocess> m_sunset;
     bool m_verbose;
+    bool m_programmatic = false;
 
-    void exec(const std::string &cmd)
+    void log_argv(const std::vector<std::string> &argv)
     {
-        if (m_verbose)
-            std::cout << "[CMD]: " << cmd << std::endl;
+        if (!m_verbose)
+            return;
+        std::cout << "[CMD]:";
+        for (const auto &arg : argv)
+            std::cout << " " << arg;
+        std::cout << std::endl;
+    }
+
+    // Gio::Subprocess reaps its children itself, so fire-and-forget callers can simply
+    // drop the returned handle. Inheriting descriptors (GLib and GTK open theirs CLOEXEC)
+    // lets GLib use posix_spawn() instead of forking the whole process.
+    Glib::RefPtr<Gio::Subprocess> spawn(std::vector<std::string> argv,
+                                        Gio::Subprocess::Flags flags)
+    {
+        log_argv(argv);
+        argv[0] = resolve_tool(argv[0]);
         try
         {
-            Glib::spawn_command_line_async(cmd);
+            return Gio::Subprocess::create(argv, flags | Gio::Subprocess::Flags::INHERIT_FDS);
         }
         catch (const Glib::Error &e)
         {
             std::cerr << e.what() << std::endl;
+            return {};
+        }
+    }
+
+    void exec(std::vector<std::string> argv)
+    {
+        spawn(std::move(argv), Gio::Subprocess::Flags::STDOUT_SILENCE);
+    }
+
+    // Run argv without blocking the main loop and hand its stdout to on_output
+    void capture_async(std::vector<std::string> argv,
+                       const std::function<void(const std::string &)> &on_output)
+    {
+        auto proc = spawn(std::move(argv), Gio::Subprocess::Flags::STDOUT_PIPE |
+                                               Gio::Subprocess::Flags::STDERR_SILENCE);
+        if (!proc)
+            return;
+
+        proc->communicate_utf8_async(
+            "",
+            [proc, on_output](Glib::RefPtr<Gio::AsyncResult> &result)
+            {
+                try
+                {
+                    on_output(proc->communicate_utf8_finish(result).first);
+                }
+                catch (const Glib::Error &e)
+                {
+                    std::cerr << e.what() << std::endl;
+                }
+            });
+    }
+
+    // The socket hyprsunset listens on, the same one `hyprctl hyprsunset` talks to
+    static std::string sunset_socket_path()
+    {
+        std::string runtime_dir = Glib::getenv("XDG_RUNTIME_DIR");
+        std::string signature = Glib::getenv("HYPRLAND_INSTANCE_SIGNATURE");
+        if (runtime_dir.empty() || signature.empty())
+            return {};
+        return Glib::build_filename(runtime_dir, "hypr", signature, ".hyprsunset.sock");
+    }
+
+    // Send a request straight to hyprsunset's socket. hyprctl is only used when the
+    // Hyprland environment is missing and the socket path cannot be built; it would
+    // connect to the same socket, so a refused connection is just reported.
+    void sunset_request(const std::vector<std::string> &args)
+    {
+        std::string path = sunset_socket_path();
+        if (path.empty())
+        {
+            std::vector<std::string> argv = {"hyprctl", "hyprsunset"};
+            argv.insert(argv.end(), args.begin(), args.end());
+            exec(argv);
+            return;
+        }
+
+        std::string request;
+        for (const auto &arg : args)
+            request += (request.empty() ? "" : " ") + arg;
+        if (m_verbose)
+            std::cout << "[IPC]: " << request << std::endl;
+
+        auto client = Gio::SocketClient::create();
+        client->connect_async(
+            Gio::UnixSocketAddress::create(path),
+            [client, request](Glib::RefPtr<Gio::AsyncResult> &result)
+            {
+                Glib::RefPtr<Gio::SocketConnection> conn;
+                try
+                {
+                    conn = client->connect_finish(result);
+                    gsize written = 0;
+                    conn->get_output_stream()->write_all(request, written);
+                }
+                catch (const Glib::Error &e)
+                {
+                    std::cerr << "hyprsunset IPC: " << e.what() << std::endl;
+                    return;
+                }
+
+                // Hold the connection until hyprsunset replies so it never writes to a
+                // socket we already closed
+                auto input = conn->get_input_stream();
+                input->read_bytes_async(
+                    64,
+                    [conn, input](Glib::RefPtr<Gio::AsyncResult> &reply)
+                    {
+                        try
+                        {
+                            input->read_bytes_finish(reply);
+                        }
+                        catch (const Glib::Error &)
+                        {
+                        }
+                    });
+            });
+    }
+
+    void start_night_light(int temp)
+    {
+        if (m_sunset)
+        {
+            // Retune the instance we already own instead of killing and respawning it
+            sunset_request({"temperature", std::to_string(temp)});
+            return;
+        }
+
+        // Wait only as long as the old instance takes to exit, not a fixed delay. The
+        // shell execs into hyprsunset, so the tracked process ends up being hyprsunset itself.
+        // The script uses the same resolved paths as every other spawn.
+        std::string pkill = Glib::shell_quote(resolve_tool("pkill"));
+        std::string pgrep = Glib::shell_quote(resolve_tool("pgrep"));
+        std::string hyprsunset = Glib::shell_quote(resolve_tool("hyprsunset"));
+        std::vector<std::string> argv = {
+            "sh", "-c",
+            pkill + " -x hyprsunset; for i in 1 2 3 4 5; do " + pgrep +
+                " -x hyprsunset >/dev/null || break; sleep 0.05; done; exec " + hyprsunset +
+                " -t " + std::to_string(temp)};
+        auto proc = spawn(argv, Gio::Subprocess::Flags::STDOUT_SILENCE);
+        if (!proc)
+            return;
+
+        m_sunset = proc;
+        proc->wait_async(
+            [this, proc](Glib::RefPtr<Gio::AsyncResult> &result)
+            {
+                try
+                {
+                    proc->wait_finish(result);
+                }
+                catch (const Glib::Error &)
+                {
+                }
+                if (m_sunset == proc)
+                    m_sunset.reset();
+            });
+    }
+
+    void stop_night_light()
+    {
+        if (!m_sunset)
+        {
+            // Nothing of ours is running; fall back to clearing a stray instance
+            exec({"pkill", "-x", "hyprsunset"});
+            return;
+        }
+        // Keep our instance alive for the next toggle and only drop the filter
+        sunset_request({"identity"});
+    }
+
+    // Move a slider without triggering the command bound to it
+    void set_value_quietly(Gtk::Scale &scale, double value)
+    {
+        m_programmatic = true;
+        scale.set_value(value);
+        m_programmatic = false;
+    }
+
+    // brightnessctl -m prints "device,class,current,percent%,max"
+    static int parse_brightness_percent(const std::string &out)
+    {
+        std::istringstream fields(out);
+        std::string field;
+        for (int i = 0; i < 4; ++i)
+        {
+            if (!std::getline(fields, field, ','))
+                return -1;
+        }
+        try
+        {
+            return std::stoi(field);
+        }
+        catch (const std::exception &)
+        {
+            return -1;
         }
     }
 
@@ -78,11 +331,120 @@ class DisplayApp : public Gtk::ApplicationWindow
         m_bright_scale.set_value(80);
         m_bright_scale.signal_value_changed().connect(
             [this]
-            { exec("brightnessctl s " + std::to_string((int) m_bright_scale.get_value()) + "%"); });
+            {
+                if (m_programmatic)
+                    return;
+
+                // Coalesce a drag into one brightnessctl call with the latest value
+                m_bright_pending = (int) m_bright_scale.get_value();
+                if (m_bright_flush_conn.connected())
+                    return;
+                m_bright_flush_conn = Glib::signal_timeout().connect(
+                    [this]()
+                    {
+                        if (m_bright_pending != m_applied_bright)
+                        {
+                            exec({"brightnessctl", "s", std::to_string(m_bright_pending) + "%"});
+                            m_applied_bright = m_bright_pending;
+                        }
+                        return false;
+                    },
+                    60);
+            });
 
         add_slider_row(box, m_bright_scale, "🔆", "💡");
         frame->set_child(*box);
         m_vbox.append(*frame);
+
+        // The slider shows the default until the real level arrives
+        find_backlight();
+        sync_brightness();
+    }
+
+    void find_backlight()
+    {
+        try
+        {
+            Glib::Dir dir(BACKLIGHT_DIR);
+            std::string name;
+            while (!(name = dir.read_name()).empty())
+            {
+                std::string device = Glib::build_filename(BACKLIGHT_DIR, name);
+                try
+                {
+                    int max = std::stoi(
+                        Glib::file_get_contents(Glib::build_filename(device, "max_brightness")));
+                    if (max <= 0)
+                        continue;
+                    m_backlight_path = Glib::build_filename(device, "brightness");
+                    m_backlight_max = max;
+                    return;
+                }
+                catch (const Glib::Error &)
+                {
+                }
+                catch (const std::exception &)
+                {
+                }
+            }
+        }
+        catch (const Glib::Error &)
+        {
+        }
+    }
+
+    void apply_brightness_reading(int percent)
+    {
+        if (percent < 0)
+            return;
+        m_applied_bright = percent;
+        set_value_quietly(m_bright_scale, percent);
+    }
+
+    // Read the level straight from sysfs, falling back to brightnessctl when there is no
+    // readable backlight node
+    void sync_brightness()
+    {
+        if (m_backlight_max == 0)
+        {
+            sync_brightness_from_brightnessctl();
+            return;
+        }
+
+        auto file = Gio::File::create_for_path(m_backlight_path);
+        file->load_contents_async(
+            [this, file](Glib::RefPtr<Gio::AsyncResult> &result)
+            {
+                char *contents = nullptr;
+                gsize length = 0;
+                int percent = -1;
+                try
+                {
+                    if (file->load_contents_finish(result, contents, length))
+                    {
+                        int raw = std::stoi(std::string(contents, length));
+                        percent = (int) std::lround(raw * 100.0 / m_backlight_max);
+                    }
+                }
+                catch (const Glib::Error &)
+                {
+                }
+                catch (const std::exception &)
+                {
+                }
+                g_free(contents);
+
+                if (percent < 0)
+                    sync_brightness_from_brightnessctl();
+                else
+                    apply_brightness_reading(percent);
+            });
+    }
+
+    void sync_brightness_from_brightnessctl()
+    {
+        capture_async({"brightnessctl", "-m"}, [this](const std::string &out)
+                      { apply_brightness_reading(parse_brightness_percent(out)); });
     }
 
     void setup_night_light()
@@ -102,12 +464,13 @@ class DisplayApp : public Gtk::ApplicationWindow
                 if (m_night_switch.get_active())
                 {
                     int temp = static_cast<int>(m_temp_scale.get_value());
-                    exec("sh -c 'pkill hyprsunset; sleep 0.1; hyprsunset -t " +
-                         std::to_string(temp) + "'");
+                    start_night_light(temp);
+                    m_applied_temp = temp;
                 }
                 else
                 {
-                    exec("pkill hyprsunset");
+                    stop_night_light();
+                    m_applied_temp = 0;
                 }
             });
 
@@ -117,15 +480,21 @@ class DisplayApp : public Gtk::ApplicationWindow
                 if (!m_night_switch.get_active())
                     return;
 
-                m_debounce_conn.disconnect();
-                m_debounce_conn = Glib::signal_timeout().connect(
+                // GTK 4 scales have no discontinuous update policy, so restart the timer on
+                // every tick and apply only once the drag has settled
+                m_temp_settle_conn.disconnect();
+                m_temp_settle_conn = Glib::signal_timeout().connect(
                     [this]()
                     {
-                        exec("hyprctl hyprsunset temperature " +
-                             std::to_string((int) m_temp_scale.get_value()));
+                        int temp = (int) m_temp_scale.get_value();
+                        if (temp != m_applied_temp)
+                        {
+                            sunset_request({"temperature", std::to_string(temp)});
+                            m_applied_temp = temp;
+                        }
                         return false;
                     },
-                    30);
+                    50);
             });
 
         box->append(m_night_switch);
@@ -142,18 +511,14 @@ class DisplayApp : public Gtk::ApplicationWindow
         grid->set_column_homogeneous(true);
         grid->set_row_spacing(5);
 
-        auto add_btn = [&](const std::string &lbl, int val, int x, int y)
+        for (const auto &rot : ROTATIONS)
         {
-            auto btn = Gtk::make_managed<Gtk::Button>(lbl);
-            btn->signal_clicked().connect(
-                [this, val] { exec("hyprctl keyword monitor ,transform," + std::to_string(val)); });
-            grid->attach(*btn, x, y);
-        };
-
-        add_btn("Normal", 0, 1, 0);
-        add_btn("Left", 1, 0, 1);
-        add_btn("Inverted", 2, 1, 2);
-        add_btn("Right", 3, 2, 1);
+            auto btn = Gtk::make_managed<Gtk::Button>(rot.label);
+            std::vector<std::string> argv = {"hyprctl", "keyword", "monitor",
+                                             ",transform," + std::to_string(rot.transform)};
+            btn->signal_clicked().connect([this, argv] { exec(argv); });
+            grid->attach(*btn, rot.col, rot.row);
+        }
 
         frame->set_child(*grid);
         m_vbox.append(*frame);
@@ -206,27 +571,55 @@ int main(int argc, char *argv[])
         (void) !std::freopen("/dev/null", "w", stderr);
     }
 
-    // use NON_UNIQUE and empty APP_ID to ensure it doesn't try to "proxy" arguments
-    // to another instance
-    auto app = Gtk::Application::create(APP_ID, Gio::Application::Flags::NON_UNIQUE);
+    // Options are parsed above, so a second launch only needs to activate the running
+    // instance over D-Bus instead of opening another window
+    auto app = Gtk::Application::create(APP_ID, Gio::Application::Flags::DEFAULT_FLAGS);
 
     app->signal_startup().connect(
         [&]
         {
+            // Resolve every dependency up front so missing tools are reported at launch
+            for (const char *tool : TOOLS)
+                resolve_tool(tool);
+
+            // Quit through the main loop on Ctrl+C or SIGTERM so shutdown cleanup still runs
+            auto quit = [](gpointer data) -> gboolean
+            {
+                static_cast<Gtk::Application *>(data)->quit();
+                return G_SOURCE_CONTINUE;
+            };
+            g_unix_signal_add(SIGINT, quit, app.get());
+            g_unix_signal_add(SIGTERM, quit, app.get());
+
             auto css = Gtk::CssProvider::create();
             css->load_from_data(CSS);
             Gtk::StyleContext::add_provider_for_display(Gdk::Display::get_default(), css,
                                                         GTK_STYLE_PROVIDER_PRIORITY_APPLICATION);
         });
 
+    DisplayApp *window = nullptr;
+
     app->signal_activate().connect(
         [&]
         {
-            auto window = new DisplayApp(verbose);
+            if (window)
+            {
+                window->present();
+                return;
+            }
+
+            window = new DisplayApp(verbose);
             app->add_window(*window);
             window->set_visible(true);
         });
 
+    app->signal_shutdown().connect(
+        [&]
+        {
+            if (window)
+                window->release_night_light();
+        });
+
     // Pass the modified args list to GTK (only containing the binary name)
     int final_argc = remaining_args.size();
     char **final_argv = remaining_args.data();